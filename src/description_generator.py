@@ -7,185 +7,315 @@ This module creates engaging Instagram descriptions using Anthropic's Claude.
 """
 
 import os
+import asyncio
 import logging
 import random
-from typing import List, Optional
+from typing import List, Optional, Union
 import base64
-import requests
-from anthropic import Anthropic
+import io
+
+from src.instagram_poster import format_hashtags
 
 logger = logging.getLogger(__name__)
 
 class DescriptionGenerator:
     """Class to generate Instagram descriptions using Claude."""
-    
-    def __init__(self, prompt_template: str, anthropic_api_key: str, 
+
+    def __init__(self, prompt_template: str, anthropic_api_key: str,
                  model: str = "claude-3-opus-20240229"):
         """
         Initialize the description generator.
-        
+
         Args:
             prompt_template: Template for prompting Claude
             anthropic_api_key: Anthropic API key for authentication
             model: The Claude model to use
         """
+        # Imported here so that importing this module stays cheap; the
+        # anthropic package is only loaded when a generator is built
+        from anthropic import AsyncAnthropic
+
         self.prompt_template = prompt_template
         self.api_key = anthropic_api_key
         self.model = model
-        self.client = Anthropic(api_key=anthropic_api_key)
-        
-        # Predefined variations for more engaging descriptions
-        self.openers = [
+        self.client = AsyncAnthropic(api_key=anthropic_api_key)
+
+        # Split the template so the static instructions can be cached by the
+        # Anthropic API and only the dynamic part is formatted per call
+        self.static_prefix, self.dynamic_template = self._split_template(prompt_template)
+
+        # Predefined variations for more engaging descriptions; tuples
+        # since these never change after construction
+        self.openers = (
             "✨ Check this out!",
             "🔥 Just created something amazing!",
             "💫 Excited to share this with you all!",
             "🌈 New day, new creation!",
             "🎨 Art in motion...",
             "👀 Take a look at my latest work!"
-        ]
-        
-        self.closers = [
+        )
+
+        self.closers = (
             "What do you think?",
             "Let me know your thoughts in the comments!",
             "Double tap if you love it!",
             "Share if this resonates with you!",
             "Tag someone who needs to see this!",
             "Save for inspiration later!"
-        ]
-        
+        )
+
+        # Bind the picker once rather than resolving random.choice per call
+        self._pick = random.choice
+
         logger.info(f"DescriptionGenerator initialized with Claude model: {model}")
-    
-    def _get_image_description(self, image_path: str) -> str:
+
+    @staticmethod
+    def _split_template(prompt_template: str) -> tuple:
         """
-        Use Claude to describe the image content.
-        
+        Split the prompt template into a static prefix and a dynamic part.
+
+        The prefix is cut at the last sentence or paragraph boundary
+        before the first format placeholder, so the cached system prompt
+        is made of complete instructions rather than a mid-sentence
+        fragment. Templates whose first sentence already contains a
+        placeholder get no static prefix. (Very short prefixes may fall
+        below Anthropic's minimum cacheable length, in which case the
+        cache_control marker is simply ignored.)
+
+        Args:
+            prompt_template: The full prompt template
+
+        Returns:
+            (static_prefix, dynamic_template): The two parts of the template
+        """
+        placeholder_pos = prompt_template.find("{")
+        if placeholder_pos <= 0:
+            return "", prompt_template
+
+        boundary = max(prompt_template.rfind(". ", 0, placeholder_pos),
+                       prompt_template.rfind("\n", 0, placeholder_pos))
+        if boundary <= 0:
+            return "", prompt_template
+
+        split_at = boundary + 1  # keep the period with the prefix
+        return prompt_template[:split_at], prompt_template[split_at:].lstrip()
+
+    # Chunk size for streaming base64 encoding; a multiple of 57 bytes
+    # (57 raw bytes -> 76 base64 chars) keeps each chunk's encoding aligned
+    # so the concatenated output is valid base64 without padding in the middle
+    _B64_CHUNK_SIZE = 57 * 1024
+
+    @classmethod
+    def _encode_image(cls, image_path: str) -> str:
+        """
+        Read an image file and encode it to base64 for Claude Vision.
+
+        The file is encoded chunk by chunk into a single buffer, so peak
+        memory stays bounded instead of holding the raw bytes and the
+        encoded bytes at the same time.
+
         Args:
             image_path: Path to the image file
-            
+
         Returns:
-            description: Basic description of the image content
+            image_data: Base64-encoded image content
         """
-        try:
-            # Read the image file and encode it to base64
-            with open(image_path, "rb") as img_file:
-                image_data = base64.b64encode(img_file.read()).decode("utf-8")
-            
-            # Use Claude Vision to describe the image
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=300,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Describe this image in detail for use in an Instagram caption."
-                            },
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/png",
-                                    "data": image_data
-                                }
-                            }
-                        ]
-                    }
-                ]
-            )
-            
-            # Extract the description from Claude's response
-            description = message.content[0].text
-            return description
-                
-        except Exception as e:
-            logger.warning(f"Failed to get image description from Claude: {e}")
-            return "An amazing image"
-    
-    def generate_description(self, prompt: str, image_path: Optional[str] = None, 
-                             max_length: int = 2000) -> str:
+        encoded = io.BytesIO()
+        with open(image_path, "rb") as img_file:
+            while chunk := img_file.read(cls._B64_CHUNK_SIZE):
+                encoded.write(base64.b64encode(chunk))
+        return encoded.getvalue().decode("ascii")
+
+    def _build_message_params(self, prompt: str, image: Union[bytes, str, None],
+                              max_length: int) -> dict:
+        """
+        Build the messages.create parameters for a caption request.
+
+        Shared between the live endpoint and the Message Batches API so
+        both paths send identical requests.
+
+        Args:
+            prompt: The prompt used to generate the image
+            image: Raw image bytes (preferred, avoids re-reading the file)
+                or a path to the generated image
+            max_length: Maximum length of the generated description
+
+        Returns:
+            params: Keyword arguments for messages.create
+        """
+        # Select random opener and closer for variety
+        pick = self._pick
+        opener = pick(self.openers)
+        closer = pick(self.closers)
+
+        # Format only the dynamic part of the template; the static prefix
+        # is sent as a cached system prompt. The image itself is attached
+        # to the same call, so Claude describes and captions in one pass.
+        formatted_prompt = self.dynamic_template.format(
+            image_prompt=prompt,
+            image_description="the attached image",
+            opener=opener,
+            closer=closer
+        )
+
+        # Build a single multimodal request: image plus caption
+        # instructions, instead of a describe call followed by a
+        # caption call. Bytes that are already in memory (straight from
+        # the image generator) skip the file read entirely.
+        image_data = None
+        if isinstance(image, (bytes, bytearray)):
+            image_data = base64.b64encode(image).decode("ascii")
+        elif image and os.path.exists(image):
+            image_data = self._encode_image(image)
+
+        content = []
+        if image_data:
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/png",
+                    "data": image_data
+                }
+            })
+        content.append({"type": "text", "text": formatted_prompt})
+
+        # The cached system prompt is omitted for templates with no
+        # static prefix (template starts with a placeholder)
+        system_blocks = []
+        if self.static_prefix:
+            system_blocks.append({
+                "type": "text",
+                "text": self.static_prefix,
+                "cache_control": {"type": "ephemeral"}
+            })
+
+        return {
+            "model": self.model,
+            "max_tokens": max_length,
+            "temperature": 0.8,
+            "system": system_blocks,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+        }
+
+    def _fallback_description(self, prompt: str) -> str:
+        """Build a simple description when Claude is unavailable."""
+        pick = self._pick
+        return f"{pick(self.openers)} {prompt} {pick(self.closers)}"
+
+    async def generate_description(self, prompt: str, image: Union[bytes, str, None] = None,
+                                   max_length: int = 2000) -> str:
         """
         Generate an engaging Instagram description.
-        
+
         Args:
             prompt: The prompt used to generate the image
-            image_path: Path to the generated image
+            image: Raw image bytes or a path to the generated image
             max_length: Maximum length of the generated description
-            
+
         Returns:
             description: Generated Instagram description
         """
         logger.info(f"Generating description for prompt: {prompt}")
-        
+
         try:
-            # Get image description if image path is provided
-            image_desc = "an amazing image"
-            if image_path and os.path.exists(image_path):
-                image_desc = self._get_image_description(image_path)
-                logger.info(f"Image description obtained from Claude")
-            
-            # Select random opener and closer for variety
-            opener = random.choice(self.openers)
-            closer = random.choice(self.closers)
-            
-            # Format the prompt for Claude
-            formatted_prompt = self.prompt_template.format(
-                image_prompt=prompt,
-                image_description=image_desc,
-                opener=opener,
-                closer=closer
-            )
-            
             # Request description from Claude
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=max_length,
-                temperature=0.8,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": formatted_prompt
-                    }
-                ]
-            )
-            
+            params = self._build_message_params(prompt, image, max_length)
+            message = await self.client.messages.create(**params)
+
             # Extract description from Claude's response
             description = message.content[0].text.strip()
-            
+
             logger.info(f"Description generated successfully ({len(description)} chars)")
             return description
-            
+
         except Exception as e:
             logger.error(f"Failed to generate description: {e}")
             # Return a fallback description
-            return f"{random.choice(self.openers)} {prompt} {random.choice(self.closers)}"
-    
+            return self._fallback_description(prompt)
+
+    async def generate_descriptions_batch(self, prompts_and_images: List[tuple],
+                                          max_length: int = 2000) -> List[str]:
+        """
+        Generate descriptions for several posts via the Message Batches API.
+
+        Batched requests are half the per-token price of the live endpoint
+        and are processed with much higher aggregate throughput, so this is
+        the preferred path when several posts are prepared ahead of their
+        publish time.
+
+        Args:
+            prompts_and_images: List of (prompt, image) tuples, where
+                image is raw bytes or a file path
+            max_length: Maximum length of each generated description
+
+        Returns:
+            descriptions: Generated descriptions, in input order
+        """
+        logger.info(f"Submitting batch of {len(prompts_and_images)} caption requests")
+
+        requests_payload = [
+            {
+                "custom_id": f"caption-{i}",
+                "params": self._build_message_params(prompt, image, max_length)
+            }
+            for i, (prompt, image) in enumerate(prompts_and_images)
+        ]
+
+        batch = await self.client.messages.batches.create(requests=requests_payload)
+        logger.info(f"Batch submitted: {batch.id}")
+
+        # Poll with exponential backoff until the batch has been processed
+        delay = 2.0
+        while batch.processing_status != "ended":
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+
+        # Collect results by custom_id; order in the results stream is
+        # not guaranteed to match submission order
+        descriptions = {}
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                descriptions[entry.custom_id] = entry.result.message.content[0].text.strip()
+            else:
+                logger.warning(f"Batch entry {entry.custom_id} failed: {entry.result.type}")
+
+        logger.info(f"Batch {batch.id} finished: {len(descriptions)}/{len(prompts_and_images)} succeeded")
+        return [
+            descriptions.get(f"caption-{i}", self._fallback_description(prompt))
+            for i, (prompt, _) in enumerate(prompts_and_images)
+        ]
+
     def add_hashtags(self, description: str, hashtags: List[str]) -> str:
         """
         Add hashtags to the description.
-        
+
         Args:
             description: The original description
             hashtags: List of hashtags to add (without # symbol)
-            
+
         Returns:
             updated_description: Description with hashtags
         """
-        # Format hashtags with # symbol
-        formatted_hashtags = [f"#{tag.strip('#')}" for tag in hashtags]
-        hashtag_text = " ".join(formatted_hashtags)
-        
+        # Format hashtags with the shared formatter
+        hashtag_text = format_hashtags(hashtags)
+
         # Add hashtags to description
         updated_description = f"{description}\n\n{hashtag_text}"
         return updated_description
-    
+
     def change_model(self, new_model: str) -> None:
         """
         Change the Claude model used.
-        
+
         Args:
             new_model: The name of the new Claude model
         """
         self.model = new_model
-        logger.info(f"Claude model changed to: {new_model}")
\ No newline at end of file
+        logger.info(f"Claude model changed to: {new_model}")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP Client Module.
+Shared httpx client configuration and retry helpers used by the
+image generator and the Instagram poster.
+"""
+
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting, server errors and the 503
+# the HuggingFace inference API returns while a model is warming up
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Create the shared httpx client with connection pooling enabled.
+
+    Returns:
+        client: Configured httpx.AsyncClient
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        transport=httpx.AsyncHTTPTransport(retries=DEFAULT_RETRIES),
+        timeout=httpx.Timeout(120.0)
+    )
+
+async def post_with_retry(client: httpx.AsyncClient, url: str,
+                          retries: int = DEFAULT_RETRIES,
+                          backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                          **kwargs) -> httpx.Response:
+    """
+    POST with exponential backoff on retryable status codes.
+
+    Args:
+        client: The shared httpx client
+        url: Target URL
+        retries: Number of retries after the first attempt
+        backoff_factor: Base delay in seconds, doubled on each retry
+        **kwargs: Passed through to client.post
+
+    Returns:
+        response: The last httpx response
+    """
+    response = None
+    for attempt in range(retries + 1):
+        response = await client.post(url, **kwargs)
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+
+        if attempt < retries:
+            delay = backoff_factor * (2 ** attempt)
+            logger.warning(
+                f"Got status {response.status_code} from {url}, "
+                f"retrying in {delay:.1f}s ({attempt + 1}/{retries})"
+            )
+            await asyncio.sleep(delay)
+
+    return response
@@ -7,113 +7,296 @@ This module handles generating images using Hugging Face Diffusion models.
 """
 
 import os
+import asyncio
+import base64
+import io
 import logging
-import requests
+import httpx
+import orjson
 import uuid
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
+from PIL import Image
+
+from src.http_client import (create_http_client, post_with_retry,
+                             RETRY_STATUS_CODES, DEFAULT_RETRIES,
+                             DEFAULT_BACKOFF_FACTOR)
 
 logger = logging.getLogger(__name__)
 
 class ImageGenerator:
     """Class to handle image generation using Hugging Face models."""
-    
-    def __init__(self, model_name: str, hf_api_key: str, style: str = "digital art"):
+
+    def __init__(self, model_name: str, hf_api_key: str, style: str = "digital art",
+                 http_client: Optional[httpx.AsyncClient] = None):
         """
         Initialize the image generator.
-        
+
         Args:
             model_name: The Hugging Face model name to use for image generation
             hf_api_key: Hugging Face API key for authentication
             style: The default style for image generation
+            http_client: Shared httpx.AsyncClient to reuse connections across components
         """
         self.model_name = model_name
         self.api_key = hf_api_key
         self.style = style
         self.api_url = f"https://api-inference.huggingface.co/models/{model_name}"
         self.headers = {"Authorization": f"Bearer {hf_api_key}"}
-        
+        self._client = http_client if http_client is not None else create_http_client()
+
         logger.info(f"ImageGenerator initialized with model: {model_name}")
-    
-    def generate_image(self, prompt: str, output_dir: str, 
-                       width: int = 1024, height: int = 1024) -> str:
+
+    def _full_prompt(self, prompt: str) -> str:
+        """Enhance the prompt with the configured style if not already included."""
+        if self.style.lower() not in prompt.lower():
+            return f"{prompt}, {self.style}"
+        return prompt
+
+    @staticmethod
+    def _generation_parameters(width: int, height: int) -> dict:
+        """Build the shared inference parameters for the HuggingFace API."""
+        return {
+            "width": width,
+            "height": height,
+            "num_inference_steps": 50,
+            "guidance_scale": 7.5,
+            "negative_prompt": "low quality, blurry, distorted"
+        }
+
+    @staticmethod
+    def _new_image_path(output_dir: str) -> str:
+        """Build a unique timestamped path for a generated image."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        unique_id = str(uuid.uuid4())[:8]
+        filename = f"generated_image_{timestamp}_{unique_id}.png"
+        return os.path.join(output_dir, filename)
+
+    @classmethod
+    def _save_image_bytes(cls, image_bytes: bytes, output_dir: str) -> str:
+        """Save image bytes under a unique timestamped filename."""
+        file_path = cls._new_image_path(output_dir)
+        with open(file_path, "wb") as f:
+            f.write(image_bytes)
+        return file_path
+
+    # Claude's largest image tier; anything bigger is billed and
+    # processed as if it were this size anyway
+    _CLAUDE_MAX_DIMENSION = 1092
+
+    @staticmethod
+    def _optimize_saved_image(file_path: str) -> None:
+        """
+        Re-compress the saved PNG in place.
+
+        Inference endpoints often return weakly compressed PNGs; one
+        optimize pass typically cuts 20-40% off the file, which shrinks
+        the Instagram upload accordingly.
+        """
+        with Image.open(file_path) as im:
+            im.save(file_path, format="PNG", optimize=True, compress_level=9)
+
+    @classmethod
+    def _vision_bytes(cls, image_bytes: bytes) -> bytes:
+        """
+        Downscale image bytes for the Claude vision call.
+
+        Resizing to Claude's 1092 px tier cap before base64 encoding
+        means fewer image tokens billed and a smaller request payload,
+        with no loss in caption quality.
+        """
+        with Image.open(io.BytesIO(image_bytes)) as im:
+            im.thumbnail((cls._CLAUDE_MAX_DIMENSION, cls._CLAUDE_MAX_DIMENSION),
+                         Image.LANCZOS)
+            buffer = io.BytesIO()
+            im.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+
+    async def generate_image(self, prompt: str, output_dir: str,
+                             width: int = 1024, height: int = 1024) -> tuple:
         """
         Generate an image based on the provided prompt.
-        
+
+        The image is saved to disk (optimized) for the Instagram upload,
+        and a downscaled copy of the bytes is returned for the Claude
+        vision call so callers don't have to read the file back.
+
         Args:
             prompt: Text description to generate the image
             output_dir: Directory to save the generated image
             width: Image width in pixels
             height: Image height in pixels
-            
+
         Returns:
-            path: Path to the generated image file
+            (path, image_bytes): Path to the saved file and the
+                vision-sized image bytes
         """
-        # Enhance prompt with style if not already included
-        if self.style.lower() not in prompt.lower():
-            full_prompt = f"{prompt}, {self.style}"
-        else:
-            full_prompt = prompt
-            
+        full_prompt = self._full_prompt(prompt)
         logger.info(f"Generating image with prompt: {full_prompt}")
-        
+
         try:
             # Prepare the payload for the API request
             payload = {
                 "inputs": full_prompt,
-                "parameters": {
-                    "width": width,
-                    "height": height,
-                    "num_inference_steps": 50,
-                    "guidance_scale": 7.5,
-                    "negative_prompt": "low quality, blurry, distorted"
-                }
+                "parameters": self._generation_parameters(width, height)
             }
-            
-            # Make the API request
-            response = requests.post(self.api_url, headers=self.headers, json=payload)
-            response.raise_for_status()
-            
-            # Generate a unique filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"generated_image_{timestamp}_{unique_id}.png"
-            file_path = os.path.join(output_dir, filename)
-            
-            # Save the image
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            
-            logger.info(f"Image generated successfully: {file_path}")
-            return file_path
-        
-        except requests.exceptions.RequestException as e:
+
+            # Stream the response to disk as it arrives, keeping one
+            # in-memory copy for the Claude vision call, and retry with
+            # backoff while the inference endpoint warms up (503) or
+            # rate limits us
+            attempt = 0
+            while True:
+                async with self._client.stream("POST", self.api_url,
+                                               headers=self.headers, json=payload) as response:
+                    if response.status_code in RETRY_STATUS_CODES and attempt < DEFAULT_RETRIES:
+                        pass  # retry below, outside the stream context
+                    else:
+                        if response.is_error:
+                            # Read the body so the error handler can log it
+                            await response.aread()
+                        response.raise_for_status()
+
+                        file_path = self._new_image_path(output_dir)
+                        image_buffer = bytearray()
+                        with open(file_path, "wb") as f:
+                            async for chunk in response.aiter_bytes(chunk_size=65536):
+                                f.write(chunk)
+                                image_buffer += chunk
+
+                        self._optimize_saved_image(file_path)
+
+                        logger.info(f"Image generated successfully: {file_path}")
+                        return file_path, self._vision_bytes(bytes(image_buffer))
+
+                delay = DEFAULT_BACKOFF_FACTOR * (2 ** attempt)
+                logger.warning(
+                    f"Got status {response.status_code} from {self.api_url}, "
+                    f"retrying in {delay:.1f}s ({attempt + 1}/{DEFAULT_RETRIES})"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        except httpx.HTTPStatusError as e:
             logger.error(f"API request failed: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                logger.error(f"Response status: {e.response.status_code}")
-                logger.error(f"Response text: {e.response.text}")
+            logger.error(f"Response status: {e.response.status_code}")
+            logger.error(f"Response text: {e.response.text}")
             raise
         except Exception as e:
             logger.error(f"Failed to generate image: {e}")
             raise
-    
+
+    async def generate_images(self, prompts: List[str], output_dir: str,
+                              width: int = 1024, height: int = 1024) -> List[tuple]:
+        """
+        Generate several images in one batched API request.
+
+        The inference endpoint accepts a list of inputs and runs them
+        through a single GPU forward pass, so N scheduled images pay one
+        request (and at most one model warm-up) instead of N.
+
+        Args:
+            prompts: Text descriptions, one per image
+            output_dir: Directory to save the generated images
+            width: Image width in pixels
+            height: Image height in pixels
+
+        Returns:
+            images: (path, vision-sized image bytes) tuples, in prompt order
+        """
+        full_prompts = [self._full_prompt(prompt) for prompt in prompts]
+        logger.info(f"Generating {len(full_prompts)} images in one batched request")
+
+        payload = {
+            "inputs": full_prompts,
+            "parameters": self._generation_parameters(width, height)
+        }
+
+        response = await post_with_retry(self._client, self.api_url,
+                                         headers=self.headers, json=payload)
+
+        async def per_prompt_fallback(reason: str) -> List[tuple]:
+            logger.warning(f"{reason}, falling back to per-prompt requests")
+            return [
+                await self.generate_image(prompt, output_dir, width, height)
+                for prompt in prompts
+            ]
+
+        # Not every endpoint accepts list inputs; fall back to one
+        # request per prompt if this one rejects the batch
+        if response.status_code == 400:
+            return await per_prompt_fallback("Endpoint rejected batched inputs")
+
+        response.raise_for_status()
+
+        images = []
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            # List of base64 images, either plain strings or wrapped in dicts
+            for item in orjson.loads(response.content):
+                if isinstance(item, dict):
+                    encoded = item.get("generated_image") or item.get("blob") or item.get("image")
+                else:
+                    encoded = item
+                if not encoded:
+                    return await per_prompt_fallback("Unrecognized batched response entry")
+                image_bytes = base64.b64decode(encoded)
+                file_path = self._save_image_bytes(image_bytes, output_dir)
+                self._optimize_saved_image(file_path)
+                images.append((file_path, self._vision_bytes(image_bytes)))
+        else:
+            # Single binary image response
+            file_path = self._save_image_bytes(response.content, output_dir)
+            self._optimize_saved_image(file_path)
+            images.append((file_path, self._vision_bytes(response.content)))
+
+        # Endpoints that don't batch may answer a list request with a
+        # single image; never hand back fewer images than prompts
+        if len(images) != len(prompts):
+            return await per_prompt_fallback(
+                f"Batched request returned {len(images)} images for {len(prompts)} prompts"
+            )
+
+        logger.info(f"Batched generation produced {len(images)} images")
+        return images
+
+    async def warm_up(self) -> None:
+        """
+        Send a minimal inference request to keep the model loaded.
+
+        The inference API evicts cold models, and reloading one can take
+        tens of seconds. A tiny generation issued shortly before a real
+        request keeps it resident. Failures are ignored — this is purely
+        an optimization.
+        """
+        payload = {
+            "inputs": "warm",
+            "parameters": {"num_inference_steps": 1, "width": 64, "height": 64}
+        }
+        try:
+            await self._client.post(self.api_url, headers=self.headers,
+                                    json=payload, timeout=30.0)
+            logger.info(f"Warm-up ping sent to {self.model_name}")
+        except Exception as e:
+            logger.debug(f"Warm-up ping failed (ignored): {e}")
+
     def change_model(self, new_model_name: str) -> None:
         """
         Change the model used for image generation.
-        
+
         Args:
             new_model_name: The name of the new Hugging Face model
         """
         self.model_name = new_model_name
         self.api_url = f"https://api-inference.huggingface.co/models/{new_model_name}"
         logger.info(f"Model changed to: {new_model_name}")
-    
+
     def change_style(self, new_style: str) -> None:
         """
         Change the default style for image generation.
-        
+
         Args:
             new_style: The new style to use (e.g., "photorealistic", "anime")
         """
         self.style = new_style
-        logger.info(f"Style changed to: {new_style}")
\ No newline at end of file
+        logger.info(f"Style changed to: {new_style}")
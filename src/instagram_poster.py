@@ -7,41 +7,75 @@ This module handles posting content to Instagram using its Graph API.
 """
 
 import os
+import asyncio
 import logging
-import requests
-import time
+import httpx
+import orjson
 from typing import Dict, List, Optional, Any, Union
-import json
+
+from src.http_client import create_http_client, post_with_retry
 
 logger = logging.getLogger(__name__)
 
+# Concurrent Graph API calls allowed in publish_many, kept low to stay
+# within Instagram rate limits
+MAX_CONCURRENT_PUBLISHES = 5
+
+def format_hashtags(hashtags: List[str], _strip=str.strip, _sep=" #") -> str:
+    """
+    Format a hashtag list as '#a #b #c'.
+
+    A single leading '#' plus a ' #' separator needs one join and no
+    per-tag f-string, versus one formatted string per tag.
+    """
+    if not hashtags:
+        return ""
+    return "#" + _sep.join(_strip(tag, "#") for tag in hashtags)
+
 class InstagramPoster:
     """Class to handle posting to Instagram using the Graph API."""
-    
-    def __init__(self, access_token: str, user_id: str):
+
+    def __init__(self, access_token: str, user_id: str,
+                 http_client: Optional[httpx.AsyncClient] = None,
+                 default_hashtags: Optional[List[str]] = None):
         """
         Initialize the Instagram poster.
-        
+
         Args:
             access_token: Instagram Graph API access token
             user_id: Instagram Business Account ID
+            http_client: Shared httpx.AsyncClient to reuse connections across components
+            default_hashtags: Hashtags used on every post; formatted once here
+                instead of on each call
         """
         self.access_token = access_token
         self.user_id = user_id
         self.api_version = "v18.0"  # Instagram Graph API version
         self.base_url = f"https://graph.facebook.com/{self.api_version}"
-        
+        self._client = http_client if http_client is not None else create_http_client()
+
+        # Cache the formatted hashtag string for the common case where
+        # every scheduled post reuses the same hashtag list
+        self._default_hashtags = list(default_hashtags) if default_hashtags else None
+        self._cached_hashtag_str = format_hashtags(default_hashtags)
+
         logger.info(f"InstagramPoster initialized for user ID: {user_id}")
-    
-    def post(self, image_path: str, caption: str, hashtags: List[str] = None) -> Dict[str, Any]:
+
+    def _format_hashtags(self, hashtags: Optional[List[str]]) -> str:
+        """Return the formatted hashtag string, using the cache when possible."""
+        if hashtags is None or hashtags == self._default_hashtags:
+            return self._cached_hashtag_str
+        return format_hashtags(hashtags)
+
+    async def post(self, image_path: str, caption: str, hashtags: List[str] = None) -> Dict[str, Any]:
         """
         Post an image to Instagram with caption.
-        
+
         Args:
             image_path: Path to the image file
             caption: Caption for the post
             hashtags: List of hashtags to add to the caption
-            
+
         Returns:
             response: API response data
         """
@@ -49,149 +83,241 @@ class InstagramPoster:
             error_msg = f"Image file not found: {image_path}"
             logger.error(error_msg)
             raise FileNotFoundError(error_msg)
-        
-        # Add hashtags to caption if provided
-        if hashtags:
-            formatted_hashtags = " ".join([f"#{tag.strip('#')}" for tag in hashtags])
+
+        # Add hashtags to caption if provided (or fall back to the defaults)
+        formatted_hashtags = self._format_hashtags(hashtags)
+        if formatted_hashtags:
             full_caption = f"{caption}\n\n{formatted_hashtags}"
         else:
             full_caption = caption
-        
+
         logger.info(f"Preparing to post image: {image_path}")
         logger.info(f"Caption length: {len(full_caption)} characters")
-        
+
         try:
             # Step 1: Create a container for the media
-            container_id = self._create_media_container(image_path, full_caption)
-            
+            container_id = await self._create_media_container(image_path, full_caption)
+
             # Step 2: Publish the container
-            publish_response = self._publish_container(container_id)
-            
+            publish_response = await self._publish_container(container_id)
+
             logger.info(f"Successfully posted to Instagram. Post ID: {publish_response.get('id', 'Unknown')}")
             return publish_response
-            
+
         except Exception as e:
             logger.error(f"Failed to post to Instagram: {e}")
             raise
-    
-    def _create_media_container(self, image_path: str, caption: str) -> str:
+
+    async def publish_many(self, items: List[tuple],
+                           hashtags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Post several prepared images at once.
+
+        All media containers are created concurrently, then each one is
+        published as soon as Instagram reports it ready, so the
+        server-side media processing of the posts overlaps instead of
+        being paid serially. Concurrency is bounded to respect rate
+        limits.
+
+        Args:
+            items: List of (image_path, caption) tuples
+            hashtags: Hashtags appended to every caption
+
+        Returns:
+            responses: Publish responses for the posts that succeeded
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_PUBLISHES)
+        formatted_hashtags = self._format_hashtags(hashtags)
+
+        async def create_one(image_path: str, caption: str):
+            full_caption = f"{caption}\n\n{formatted_hashtags}" if formatted_hashtags else caption
+            async with semaphore:
+                return await self._create_media_container(image_path, full_caption)
+
+        container_ids = await asyncio.gather(
+            *(create_one(image_path, caption) for image_path, caption in items),
+            return_exceptions=True
+        )
+
+        async def publish_one(container_id: str):
+            async with semaphore:
+                return await self._publish_container(container_id)
+
+        publish_tasks = []
+        for container_id in container_ids:
+            if isinstance(container_id, Exception):
+                logger.error(f"Failed to create media container: {container_id}")
+            else:
+                publish_tasks.append(publish_one(container_id))
+
+        # Publish each container as soon as its polling finishes
+        responses = []
+        for finished in asyncio.as_completed(publish_tasks):
+            try:
+                responses.append(await finished)
+            except Exception as e:
+                logger.error(f"Failed to publish container: {e}")
+
+        logger.info(f"Published {len(responses)}/{len(items)} posts")
+        return responses
+
+    @staticmethod
+    async def _stream_file(image_path: str, chunk_size: int = 64 * 1024):
+        """Yield the file in chunks so uploads never buffer it whole."""
+        with open(image_path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    async def _create_media_container(self, image_path: str, caption: str) -> str:
         """
-        Create a container for the media.
-        
+        Create a container for the media via resumable upload.
+
+        The image bytes are PUT straight to the Graph API's upload URI,
+        so no intermediate public hosting (S3/Cloudinary) round trip is
+        needed and the file is streamed rather than loaded into memory.
+
         Args:
             image_path: Path to the image file
             caption: Caption for the post
-            
+
         Returns:
             container_id: ID of the created media container
         """
         url = f"{self.base_url}/{self.user_id}/media"
-        
-        # For Instagram, we need to provide a URL to the image
-        # In a real implementation, this would require uploading the image to a public URL
-        # For this example, we'll use a placeholder approach
-        image_url = self._upload_image_to_temporary_storage(image_path)
-        
+
         params = {
-            "image_url": image_url,
+            "upload_type": "resumable",
+            "media_type": "IMAGE",
             "caption": caption,
             "access_token": self.access_token
         }
-        
-        response = requests.post(url, data=params)
-        
-        if response.status_code != 200:
-            error_msg = f"Failed to create media container: {response.text}"
+
+        response = await post_with_retry(self._client, url, data=params)
+
+        if not response.is_success:
+            error_msg = f"Failed to create media container: {response.text[:500]}"
             logger.error(error_msg)
             raise Exception(error_msg)
-        
-        result = response.json()
+
+        result = orjson.loads(response.content)
         container_id = result.get("id")
-        
-        if not container_id:
-            error_msg = "Container ID not found in response"
+        upload_uri = result.get("uri")
+
+        if not container_id or not upload_uri:
+            error_msg = "Container ID or upload URI not found in response"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+
+        # Stream the image bytes directly to the upload URI
+        file_size = os.path.getsize(image_path)
+        headers = {
+            "Authorization": f"OAuth {self.access_token}",
+            "offset": "0",
+            "file_size": str(file_size)
+        }
+
+        upload_response = await self._client.post(
+            upload_uri, headers=headers, content=self._stream_file(image_path)
+        )
+
+        if not upload_response.is_success:
+            error_msg = f"Failed to upload image bytes: {upload_response.text[:500]}"
             logger.error(error_msg)
             raise Exception(error_msg)
-        
-        logger.info(f"Media container created: {container_id}")
+
+        logger.info(f"Media container created and image uploaded: {container_id}")
         return container_id
-    
-    def _publish_container(self, container_id: str) -> Dict[str, Any]:
+
+    async def _wait_for_container_ready(self, container_id: str, max_wait: float = 30.0) -> None:
+        """
+        Poll the media container until Instagram reports it ready.
+
+        Polls the container's status_code field with exponential backoff
+        (0.5, 1, 2, 4 s) and returns as soon as it is FINISHED, instead of
+        sleeping a fixed amount and hoping.
+
+        Args:
+            container_id: ID of the media container
+            max_wait: Maximum total seconds to wait before giving up
+        """
+        url = f"{self.base_url}/{container_id}"
+        params = {"fields": "status_code", "access_token": self.access_token}
+
+        waited = 0.0
+        attempt = 0
+        while True:
+            response = await self._client.get(url, params=params)
+            status = orjson.loads(response.content).get("status_code") if response.is_success else None
+
+            if status == "FINISHED":
+                logger.info(f"Container {container_id} ready after {waited:.1f}s")
+                return
+            if status in ("ERROR", "EXPIRED"):
+                error_msg = f"Media container {container_id} entered state {status}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+            if waited >= max_wait:
+                error_msg = f"Media container {container_id} not ready after {max_wait}s"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+
+            delay = min(2 ** attempt * 0.5, 4.0)
+            await asyncio.sleep(delay)
+            waited += delay
+            attempt += 1
+
+    async def _publish_container(self, container_id: str) -> Dict[str, Any]:
         """
         Publish the media container.
-        
+
         Args:
             container_id: ID of the media container
-            
+
         Returns:
             response: API response data
         """
         url = f"{self.base_url}/{self.user_id}/media_publish"
-        
+
         params = {
             "creation_id": container_id,
             "access_token": self.access_token
         }
-        
-        # Wait a moment for the container to be ready
-        time.sleep(5)
-        
-        response = requests.post(url, data=params)
-        
-        if response.status_code != 200:
-            error_msg = f"Failed to publish media: {response.text}"
+
+        # Publish as soon as the container is actually ready
+        await self._wait_for_container_ready(container_id)
+
+        response = await post_with_retry(self._client, url, data=params)
+
+        if not response.is_success:
+            error_msg = f"Failed to publish media: {response.text[:500]}"
             logger.error(error_msg)
             raise Exception(error_msg)
-        
-        result = response.json()
+
+        result = orjson.loads(response.content)
         logger.info(f"Media published successfully: {result}")
         return result
-    
-    def _upload_image_to_temporary_storage(self, image_path: str) -> str:
-        """
-        Upload image to temporary storage to get a public URL.
-        
-        In a real implementation, this would upload to a service like AWS S3.
-        For this example code, it's a placeholder that would need to be implemented
-        with a real file hosting service.
-        
-        Args:
-            image_path: Path to the image file
-            
-        Returns:
-            url: Public URL to the uploaded image
-        """
-        # This is a placeholder function
-        # In a real implementation, you would upload the image to a hosting service
-        # and return the public URL
-        
-        logger.info(f"In a real implementation, would upload {image_path} to obtain a public URL")
-        
-        # Placeholder return - in a real implementation, replace with actual upload code
-        # Example services: AWS S3, Cloudinary, Imgur API, etc.
-        return f"https://example.com/temp_images/{os.path.basename(image_path)}"
-    
-    def get_account_info(self) -> Dict[str, Any]:
+
+    async def get_account_info(self) -> Dict[str, Any]:
         """
         Get information about the Instagram Business Account.
-        
+
         Returns:
             account_info: Information about the account
         """
         url = f"{self.base_url}/{self.user_id}"
-        
+
         params = {
             "fields": "username,name,profile_picture_url,media_count,followers_count,follows_count",
             "access_token": self.access_token
         }
-        
-        response = requests.get(url, params=params)
-        
-        if response.status_code != 200:
-            error_msg = f"Failed to get account info: {response.text}"
+
+        response = await self._client.get(url, params=params)
+
+        if not response.is_success:
+            error_msg = f"Failed to get account info: {response.text[:500]}"
             logger.error(error_msg)
             raise Exception(error_msg)
-        
-        result = response.json()
+
+        result = orjson.loads(response.content)
         logger.info(f"Retrieved account info for: {result.get('username', 'Unknown')}")
-        return result
\ No newline at end of file
+        return result
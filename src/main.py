@@ -8,56 +8,124 @@ creating descriptions, and posting to Instagram.
 """
 
 import os
-import json
-import time
+import orjson
+import asyncio
 import logging
 import argparse
+import operator
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any
+from functools import reduce
+from typing import List
 import sys
-from dotenv import load_dotenv
-
-# Cargar variables de entorno
-load_dotenv()
 
 # Add parent directory to path to import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.http_client import create_http_client
 from src.image_generator import ImageGenerator
 from src.description_generator import DescriptionGenerator
 from src.instagram_poster import InstagramPoster
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("instagram_automation.log"),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
-def load_config(config_path: str = "config/config.json") -> Dict[str, Any]:
-    """Load configuration from JSON file."""
+@dataclass(slots=True)
+class InstagramKeys:
+    """Instagram Graph API credentials."""
+    access_token: str
+    user_id: str
+
+@dataclass(slots=True)
+class ApiKeys:
+    """All third-party API credentials."""
+    huggingface: str
+    anthropic: str
+    instagram: InstagramKeys
+
+@dataclass(slots=True)
+class ImageGenCfg:
+    """Settings for the HuggingFace image generator."""
+    model_name: str
+    style: str
+    default_prompt: str
+
+@dataclass(slots=True)
+class DescGenCfg:
+    """Settings for the Claude description generator."""
+    model: str
+    prompt_template: str
+
+@dataclass(slots=True)
+class InstaCfg:
+    """Settings for the Instagram posting schedule."""
+    default_hashtags: List[str]
+    post_frequency_hours: float
+    scheduled_posts_count: int = 5
+
+@dataclass(slots=True)
+class Config:
+    """Validated application configuration."""
+    api_keys: ApiKeys
+    image_generator: ImageGenCfg
+    description_generator: DescGenCfg
+    instagram_poster: InstaCfg
+    output_directory: str = "output"
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> "Config":
+        """Build a validated Config from the raw JSON dict."""
+        api_keys = dict(raw["api_keys"])
+        api_keys["instagram"] = InstagramKeys(**api_keys["instagram"])
+        return cls(
+            api_keys=ApiKeys(**api_keys),
+            image_generator=ImageGenCfg(**raw["image_generator"]),
+            description_generator=DescGenCfg(**raw["description_generator"]),
+            instagram_poster=InstaCfg(**raw["instagram_poster"]),
+            output_directory=raw.get("output_directory", "output")
+        )
+
+def _load_env():
+    """Load .env variables; dotenv is only imported when actually running."""
+    from dotenv import load_dotenv
+
+    # Cargar variables de entorno
+    load_dotenv()
+
+def _configure_logging():
+    """Configure logging for a CLI run (not when imported as a library)."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("instagram_automation.log"),
+            logging.StreamHandler()
+        ]
+    )
+
+# Environment variables that override config values, with the path to
+# the value inside the raw config dict; adding an override is one row here
+ENV_OVERRIDES = (
+    ("HUGGINGFACE_API_KEY", ("api_keys", "huggingface")),
+    ("ANTHROPIC_API_KEY", ("api_keys", "anthropic")),
+    ("INSTAGRAM_ACCESS_TOKEN", ("api_keys", "instagram", "access_token")),
+    ("INSTAGRAM_USER_ID", ("api_keys", "instagram", "user_id")),
+)
+
+def load_config(config_path: str = "config/config.json") -> Config:
+    """Load and validate configuration from JSON file."""
     try:
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-        
+        with open(config_path, 'rb') as f:
+            raw = orjson.loads(f.read())
+
         # Reemplazar valores con variables de entorno si están disponibles
-        if os.getenv("HUGGINGFACE_API_KEY"):
-            config["api_keys"]["huggingface"] = os.getenv("HUGGINGFACE_API_KEY")
-        
-        if os.getenv("ANTHROPIC_API_KEY"):
-            config["api_keys"]["anthropic"] = os.getenv("ANTHROPIC_API_KEY")
-            
-        if os.getenv("INSTAGRAM_ACCESS_TOKEN"):
-            config["api_keys"]["instagram"]["access_token"] = os.getenv("INSTAGRAM_ACCESS_TOKEN")
-            
-        if os.getenv("INSTAGRAM_USER_ID"):
-            config["api_keys"]["instagram"]["user_id"] = os.getenv("INSTAGRAM_USER_ID")
-            
+        for env_var, path in ENV_OVERRIDES:
+            value = os.getenv(env_var)
+            if value:
+                reduce(operator.getitem, path[:-1], raw)[path[-1]] = value
+
+        # Fail on malformed config here, before any API client is built
+        config = Config.from_dict(raw)
+
         logger.info(f"Configuration loaded from {config_path}")
         return config
     except Exception as e:
@@ -78,91 +146,186 @@ def main():
     parser.add_argument('--mode', choices=['single', 'scheduled'], default='single',
                         help='Run mode: single (one post) or scheduled (recurring posts)')
     args = parser.parse_args()
-    
+
+    _configure_logging()
+    _load_env()
+
     try:
-        # Load configuration
-        config = load_config(args.config)
-        output_dir = create_output_directory(config.get("output_directory", "output"))
-        
+        asyncio.run(run(args))
+    except Exception as e:
+        logger.error(f"Error in main execution: {e}")
+        raise
+
+async def run(args):
+    """Build the components and dispatch to the requested workflow."""
+    # Load configuration
+    config = load_config(args.config)
+    output_dir = create_output_directory(config.output_directory)
+
+    # Shared HTTP client so all components reuse pooled connections
+    async with create_http_client() as http_client:
         # Initialize components
         image_gen = ImageGenerator(
-            model_name=config["image_generator"]["model_name"],
-            hf_api_key=config["api_keys"]["huggingface"],
-            style=config["image_generator"]["style"]
+            model_name=config.image_generator.model_name,
+            hf_api_key=config.api_keys.huggingface,
+            style=config.image_generator.style,
+            http_client=http_client
         )
-        
+
         desc_gen = DescriptionGenerator(
-            prompt_template=config["description_generator"]["prompt_template"],
-            anthropic_api_key=config["api_keys"]["anthropic"],
-            model=config["description_generator"]["model"]
+            prompt_template=config.description_generator.prompt_template,
+            anthropic_api_key=config.api_keys.anthropic,
+            model=config.description_generator.model
         )
-        
+
         insta_poster = InstagramPoster(
-            access_token=config["api_keys"]["instagram"]["access_token"],
-            user_id=config["api_keys"]["instagram"]["user_id"]
+            access_token=config.api_keys.instagram.access_token,
+            user_id=config.api_keys.instagram.user_id,
+            http_client=http_client,
+            default_hashtags=config.instagram_poster.default_hashtags
         )
-        
+
         if args.mode == 'single':
             # Generate and post once
-            single_post_workflow(image_gen, desc_gen, insta_poster, config, output_dir)
+            await single_post_workflow(image_gen, desc_gen, insta_poster, config, output_dir)
         else:
             # Schedule recurring posts
-            scheduled_workflow(image_gen, desc_gen, insta_poster, config, output_dir)
-            
-    except Exception as e:
-        logger.error(f"Error in main execution: {e}")
-        raise
+            await scheduled_workflow(image_gen, desc_gen, insta_poster, config, output_dir)
 
-def single_post_workflow(image_gen, desc_gen, insta_poster, config, output_dir):
+async def single_post_workflow(image_gen, desc_gen, insta_poster, config, output_dir):
     """Execute a single post workflow."""
     try:
-        # Generate image
-        prompt = config["image_generator"]["default_prompt"]
-        image_path = image_gen.generate_image(prompt, output_dir)
+        # Generate image, keeping the bytes for the vision call
+        prompt = config.image_generator.default_prompt
+        image_path, image_bytes = await image_gen.generate_image(prompt, output_dir)
         logger.info(f"Image generated: {image_path}")
-        
-        # Generate description
-        description = desc_gen.generate_description(prompt, image_path)
+
+        # Generate description from the in-memory bytes
+        description = await desc_gen.generate_description(prompt, image_bytes)
         logger.info(f"Description generated: {description[:50]}...")
-        
+
         # Post to Instagram
-        result = insta_poster.post(image_path, description, 
-                                  hashtags=config["instagram_poster"]["default_hashtags"])
-        
+        result = await insta_poster.post(image_path, description,
+                                         hashtags=config.instagram_poster.default_hashtags)
+
         logger.info(f"Posted to Instagram successfully: {result}")
         return result
-    
+
     except Exception as e:
         logger.error(f"Error in single post workflow: {e}")
         raise
 
-def scheduled_workflow(image_gen, desc_gen, insta_poster, config, output_dir):
+# How long before a scheduled tick the inference model is pinged awake
+WARM_UP_LEAD_SECONDS = 300
+
+async def _warm_up_before_tick(image_gen, delay_seconds):
+    """Ping the inference endpoint shortly before the next scheduled tick."""
+    await asyncio.sleep(delay_seconds)
+    await image_gen.warm_up()
+
+async def prepare_posts_ahead(image_gen, desc_gen, prompt, output_dir, count):
+    """
+    Pre-generate images and captions for several posts.
+
+    All images go through one batched HuggingFace request and all
+    captions through the Message Batches API in one submission, so only
+    the publish step remains time-scheduled.
+    """
+    images = await image_gen.generate_images([prompt] * count, output_dir)
+    logger.info(f"Pre-generated {len(images)} images")
+
+    captions = await desc_gen.generate_descriptions_batch(
+        [(prompt, image_bytes) for _, image_bytes in images]
+    )
+    return [(image_path, caption) for (image_path, _), caption in zip(images, captions)]
+
+async def scheduled_workflow(image_gen, desc_gen, insta_poster, config, output_dir):
     """Execute scheduled posting workflow."""
-    post_frequency = config["instagram_poster"]["post_frequency_hours"]
-    total_posts = config["instagram_poster"].get("scheduled_posts_count", 5)
-    
+    post_frequency = config.instagram_poster.post_frequency_hours
+    total_posts = config.instagram_poster.scheduled_posts_count
+    prompt = config.image_generator.default_prompt
+    hashtags = config.instagram_poster.default_hashtags
+
     logger.info(f"Starting scheduled workflow. Posts: {total_posts}, Frequency: {post_frequency}h")
-    
-    for i in range(total_posts):
-        try:
-            logger.info(f"Executing scheduled post {i+1}/{total_posts}")
-            
-            # Execute single post workflow
-            single_post_workflow(image_gen, desc_gen, insta_poster, config, output_dir)
-            
-            # Skip sleep after the last post
-            if i < total_posts - 1:
+
+    # For more than a couple of posts, pre-generate everything through the
+    # Message Batches API (half price, higher throughput) and only schedule
+    # the publish step. Small runs stay on the live endpoint.
+    if total_posts > 2:
+        prepared_posts = await prepare_posts_ahead(
+            image_gen, desc_gen, prompt, output_dir, total_posts
+        )
+
+        for i, (image_path, caption) in enumerate(prepared_posts):
+            if i:
                 sleep_seconds = post_frequency * 3600
                 next_post_time = datetime.now().timestamp() + sleep_seconds
                 next_post_readable = datetime.fromtimestamp(next_post_time).strftime('%Y-%m-%d %H:%M:%S')
-                
                 logger.info(f"Next post scheduled at {next_post_readable}, sleeping for {post_frequency} hours")
-                time.sleep(sleep_seconds)
-        
+                await asyncio.sleep(sleep_seconds)
+
+            try:
+                logger.info(f"Publishing scheduled post {i+1}/{total_posts}")
+                await insta_poster.post(image_path, caption, hashtags=hashtags)
+            except Exception as e:
+                # Continue with the other posts even if this one fails
+                logger.error(f"Error in post {i+1}: {e}")
+        return
+
+    # Live fallback for small runs: a background producer generates the
+    # next post's image and caption during the sleep before its publish
+    # slot, so the scheduled tick only has to publish
+    queue = asyncio.Queue(maxsize=2)
+
+    async def producer():
+        try:
+            for _ in range(total_posts):
+                image_path, image_bytes = await image_gen.generate_image(prompt, output_dir)
+                caption = await desc_gen.generate_description(prompt, image_bytes)
+                await queue.put((image_path, caption))
         except Exception as e:
-            logger.error(f"Error in post {i+1}: {e}")
-            # Continue with next post even if current one fails
-            continue
+            logger.error(f"Post generation pipeline failed: {e}")
+            # Unblock the consumer so it doesn't wait forever
+            await queue.put(None)
+
+    producer_task = asyncio.create_task(producer())
+    warm_up_task = None
+
+    try:
+        for i in range(total_posts):
+            if i:
+                sleep_seconds = post_frequency * 3600
+                next_post_time = datetime.now().timestamp() + sleep_seconds
+                next_post_readable = datetime.fromtimestamp(next_post_time).strftime('%Y-%m-%d %H:%M:%S')
+                logger.info(f"Next post scheduled at {next_post_readable}, sleeping for {post_frequency} hours")
+
+                # Wake the inference model shortly before the tick so the
+                # producer's next generation doesn't hit a cold start
+                if sleep_seconds > WARM_UP_LEAD_SECONDS:
+                    warm_up_task = asyncio.create_task(
+                        _warm_up_before_tick(image_gen, sleep_seconds - WARM_UP_LEAD_SECONDS)
+                    )
+
+                await asyncio.sleep(sleep_seconds)
+
+            prepared = await queue.get()
+            if prepared is None:
+                logger.error("Stopping scheduled workflow: generation pipeline crashed")
+                break
+
+            image_path, caption = prepared
+            try:
+                logger.info(f"Publishing scheduled post {i+1}/{total_posts}")
+                await insta_poster.post(image_path, caption, hashtags=hashtags)
+            except Exception as e:
+                # Continue with the other posts even if this one fails
+                logger.error(f"Error in post {i+1}: {e}")
+    finally:
+        # Don't leak background tasks if publishing failed or was interrupted
+        if not producer_task.done():
+            producer_task.cancel()
+        if warm_up_task is not None and not warm_up_task.done():
+            warm_up_task.cancel()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()